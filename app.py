@@ -1,44 +1,182 @@
-import os
-
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from datetime import datetime
+
+import click
+from flask import (
+    Blueprint, Flask, abort, current_app, jsonify, render_template,
+    stream_template, request, flash, get_flashed_messages, redirect, session, g)
+from flask.ctx import _AppCtxGlobals
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
 
+from autocomplete import username_index
+from cache import followed_celebrities_cache, liked_ids_cache, user_cache
+from config import get_config
+from credentials import CredentialsBusy
 from forms import UserAddForm, LoginForm, MessageForm, UserUpdateForm, ForValidationForm
-from models import db, connect_db, User, Message, Like
+from models import db, bcrypt, connect_db, User, Message, Like, Follows
+from pagination import STREAM_BATCH_SIZE, StreamedPage, cursor_arg
+from ratelimit import RateLimited, rate_limiter
+from search import search_users
+import autocomplete
+import cache
+import credentials
+import ratelimit
+import timeline
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+bp = Blueprint('warbler', __name__, cli_group=None)
+
+
+class LazyGlobals(_AppCtxGlobals):
+    """Flask `g` whose registered attributes are loaded on first access.
+
+    A request that never reads `g.user` (static files, redirects, most
+    POSTs) never pays for loading it. `g.get()` and `in` count registered
+    attributes as present, loaded or not.
+    """
+
+    loaders = {}
+
+    def __getattr__(self, name):
+        try:
+            loader = self.loaders[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        value = loader()
+        setattr(self, name, value)
+        return value
+
+    def get(self, name, default=None):
+        if name in self.loaders:
+            return getattr(self, name)
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgresql:///warbler'))
+        return super().get(name, default)
+
+    def __contains__(self, item):
+        return item in self.loaders or super().__contains__(item)
+
+    def reset(self):
+        """Forget loaded values, so they're loaded afresh on next access."""
+
+        for name in self.loaders:
+            self.__dict__.pop(name, None)
+
+
+def lazy_global(name):
+    """Register the decorated function as the loader for `g.<name>`."""
+
+    def register(loader):
+        LazyGlobals.loaders[name] = loader
+        return loader
+
+    return register
+
+
+def create_app(profile=None):
+    """Create the Warbler app with config `profile` ('dev', 'test' or 'prod';
+    defaults to the WARBLER_ENV environment variable, then 'dev').
+    """
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+    app = Flask(__name__)
+    app.app_ctx_globals_class = LazyGlobals
+    app.config.from_object(get_config(profile))
 
-connect_db(app)
+    if app.config['DEBUG_TOOLBAR']:
+        # imported here so other profiles don't pay for loading it
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    cache.init_app(app)
+    autocomplete.init_app(app)
+    ratelimit.init_app(app)
+    app.register_blueprint(bp)
+
+    return app
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
-def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+@lazy_global('user')
+def load_user():
+    """g.user: the logged-in user, or None."""
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
-        g.form = ForValidationForm()
+        return user_cache().get(session[CURR_USER_KEY])
 
-    else:
-        g.user = None
+    return None
+
+
+@lazy_global('form')
+def load_form():
+    """g.form: form for CSRF-protected buttons (follow, like, logout...)."""
+
+    return ForValidationForm()
+
+
+@lazy_global('following_ids')
+def load_following_ids():
+    """g.following_ids: ids of the users the current user follows."""
+
+    return g.user.following_ids() if g.user else set()
+
+
+@bp.before_app_request
+def reset_lazy_globals():
+    """Forget what an earlier request loaded into `g`.
+
+    `g` belongs to the app context, and a request inside an already pushed
+    one (a test's, a CLI command's) shares it with the requests before it.
+    """
+
+    g.reset()
+
+
+def following_ids():
+    """Ids of the users the current user follows, loaded once per request.
+
+    Available in templates, so list pages can check follow state per card
+    with a set lookup.
+    """
+
+    return g.following_ids
+
+
+def liked_ids(messages):
+    """Ids of those of `messages` the current user likes (none if logged out)."""
+
+    if not g.user:
+        return set()
+
+    return liked_ids_cache().liked(g.user, [msg.id for msg in messages])
+
+
+def stream_page(template_name, **context):
+    """stream_template(), for pages whose templates use the session.
+
+    The session cookie goes out with the headers, before the body renders,
+    so session writes the template would make are made here first: taking
+    the flashed messages (which get_flashed_messages() then hands back
+    again) and Flask-WTF's CSRF secret.
+    """
+
+    get_flashed_messages()
+    generate_csrf()
+
+    return stream_template(template_name, **context)
+
+
+@bp.app_context_processor
+def add_following_ids():
+    """Make following_ids() available to templates."""
+
+    return {'following_ids': following_ids}
 
 
 def do_login(user):
@@ -54,7 +192,28 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+def wants_json():
+    """Did the client ask (in its Accept header) for JSON rather than a page?
+
+    The like and follow actions answer these clients with the new state
+    instead of a redirect, sparing a full page render per click.
+    """
+
+    return request.accept_mimetypes.best_match(
+        ['text/html', 'application/json']) == 'application/json'
+
+
+def unauthorized():
+    """Response for an action that needs a logged-in user."""
+
+    if wants_json():
+        return jsonify(error="Access unauthorized."), 401
+
+    flash("Access unauthorized.", "danger")
+    return redirect("/")
+
+
+@bp.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -69,6 +228,8 @@ def signup():
     form = UserAddForm()
 
     if form.validate_on_submit():
+        rate_limiter().limit_auth(form.username.data)
+
         try:
             user = User.signup(
                 username=form.username.data,
@@ -77,6 +238,7 @@ def signup():
                 image_url=form.image_url.data or User.image_url.default.arg,
             )
             db.session.commit()
+            username_index().add(user.id, user.username)
 
         except IntegrityError:
             flash("Username already taken", 'danger')
@@ -90,17 +252,23 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
     form = LoginForm()
 
     if form.validate_on_submit():
+        rate_limiter().limit_auth(form.username.data)
         user = User.authenticate(form.username.data,
                                  form.password.data)
 
         if user:
+            if db.session.is_modified(user):
+                # authenticate() upgraded the password hash
+                db.session.commit()
+                user_cache().invalidate(user.id)
+
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -110,7 +278,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout', methods=["POST"])
+@bp.route('/logout', methods=["POST"])
 def logout():
     """Handle logout of user - deletes user from session and
         redirects to login page."""
@@ -123,95 +291,207 @@ def logout():
         return redirect("/login")    
 
 
+@bp.app_errorhandler(RateLimited)
+def rate_limited(error):
+    """Refuse logins and signups over their rate limit (see ratelimit.py)."""
+
+    return ("Too many attempts; please wait and try again.",
+            429, {'Retry-After': str(error.retry_after)})
+
+
+@bp.app_errorhandler(CredentialsBusy)
+def credentials_busy(error):
+    """Shed logins and signups while the password hashing pool is full."""
+
+    return ("Too many logins right now; please try again in a moment.",
+            503, {'Retry-After': '1'})
+
+
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+def user_cards():
+    """User query that loads only the columns the user cards render."""
+
+    return User.query.options(load_only(User.id,
+                                        User.username,
+                                        User.image_url,
+                                        User.header_image_url,
+                                        User.bio))
+
+
+@bp.route('/users')
 def list_users():
-    """Page with listing of users.
-    Can take a 'q' param in querystring to search by that username.
+    """Page with listing of users, USERS_PAGE_SIZE at a time.
+    Can take a 'q' param in querystring to search by that username,
+    and an 'after' param with the cursor of the previous page.
     """
 
     search = request.args.get('q')
+    page_size = current_app.config['USERS_PAGE_SIZE']
 
     if not search:
-        users = User.query.all()
-    else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        users = user_cards().order_by(User.id)
+        after = cursor_arg(int, name='after')
+
+        if after:
+            users = users.filter(User.id > after[0])
+
+        page = StreamedPage(users, page_size, lambda user: (user.id,))
 
-    return render_template('users/index.html', users=users)
+        return stream_page('users/index.html', users=page, page=page)
 
+    try:
+        page = search_users(search,
+                            limit=page_size,
+                            cursor=request.args.get('after'),
+                            query=user_cards())
+    except ValueError:
+        abort(400)
 
-@app.route('/users/<int:user_id>')
+    return render_template('users/index.html', users=page.items, page=page)
+
+
+@bp.route('/users/autocomplete')
+def autocomplete_users():
+    """JSON list of up to AUTOCOMPLETE_LIMIT users whose username starts
+    with the 'q' param: [{"id": 1, "username": "..."}, ...]
+    """
+
+    prefix = request.args.get('q', '')
+    matches = (username_index().search(prefix, current_app.config['AUTOCOMPLETE_LIMIT'])
+               if prefix else [])
+
+    return jsonify([{'id': user_id, 'username': username}
+                    for user_id, username in matches])
+
+
+@bp.route('/users/<int:user_id>')
 def users_show(user_id):
-    """Show user profile."""
+    """Show user profile, with PROFILE_PAGE_SIZE of their messages.
+
+    Takes the cursor of the previous page of messages in the 'before' param.
+    """
 
     user = User.query.get_or_404(user_id)
-    liked_msg_ids = [lm.id for lm in g.user.liked_messages]
+    page = user.messages_page(limit=current_app.config['PROFILE_PAGE_SIZE'],
+                              before=cursor_arg(datetime, int))
+    # the viewer's likes, not the profile owner's
+    liked_msg_ids = liked_ids(page.items)
+
+    return render_template('users/show.html', user=user, page=page, likes=liked_msg_ids)
 
-    return render_template('users/show.html', user=user, likes=liked_msg_ids)
 
+def follows_page(user_id_column, where):
+    """StreamedPage of the users whose id is `user_id_column` in the follows
+    rows matching `where`, FOLLOWS_PAGE_SIZE at a time, in id order.
 
-@app.route('/users/<int:user_id>/following')
+    Keyed on the follows index, so a page costs the same however many
+    follows there are. Takes the previous page's cursor in the 'after' param.
+    """
+
+    follows = (user_cards()
+               .join(Follows, user_id_column == User.id)
+               .filter(where)
+               .order_by(user_id_column))
+    after = cursor_arg(int, name='after')
+
+    if after:
+        follows = follows.filter(user_id_column > after[0])
+
+    return StreamedPage(follows,
+                        current_app.config['FOLLOWS_PAGE_SIZE'],
+                        lambda user: (user.id,))
+
+
+@bp.route('/users/<int:user_id>/following')
 def show_following(user_id):
-    """Show list of people this user is following."""
+    """Show a page of the people this user is following."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    page = follows_page(Follows.user_being_followed_id,
+                        Follows.user_following_id == user.id)
+
+    return stream_page('users/following.html', user=user, following=page, page=page)
 
 
-@app.route('/users/<int:user_id>/followers')
+@bp.route('/users/<int:user_id>/followers')
 def users_followers(user_id):
-    """Show list of followers of this user."""
+    """Show a page of the followers of this user."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    page = follows_page(Follows.user_following_id,
+                        Follows.user_being_followed_id == user.id)
+
+    return stream_page('users/followers.html', user=user, followers=page, page=page)
+
 
+def follow_state(followed_user, following):
+    """JSON for a follow/unfollow of `followed_user` by the current user."""
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+    return jsonify(user_id=followed_user.id,
+                   following=following,
+                   following_count=g.user.following_count,
+                   followers_count=followed_user.followers_count)
+
+
+@bp.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
     if not g.user:
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
     
     form = ForValidationForm()
     if form.validate_on_submit():
         followed_user = User.query.get_or_404(follow_id)
-        g.user.following.append(followed_user)
-        db.session.commit()
+
+        # a repeated follow (double click, stale page) changes nothing
+        if g.user.follow(followed_user):
+            timeline.backfill(g.user, followed_user)
+            db.session.commit()
+            user_cache().invalidate(g.user.id, followed_user.id)
+            followed_celebrities_cache().invalidate(g.user.id)
+
+        if wants_json():
+            return follow_state(followed_user, following=followed_user.id != g.user.id)
 
         return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@bp.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
     if not g.user:
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
 
     form = ForValidationForm()
 
     if form.validate_on_submit():
-        followed_user = User.query.get(follow_id)
-        g.user.following.remove(followed_user)
-        db.session.commit()
+        followed_user = User.query.get_or_404(follow_id)
+
+        if g.user.unfollow(followed_user):
+            timeline.remove(g.user, followed_user)
+            db.session.commit()
+            user_cache().invalidate(g.user.id, followed_user.id)
+            followed_celebrities_cache().invalidate(g.user.id)
+
+        if wants_json():
+            return follow_state(followed_user, following=False)
 
         return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -221,10 +501,11 @@ def profile():
 
     form = UserUpdateForm(obj=g.user)
 
-    if form.validate_on_submit() and not User.authenticate(g.user.username, form.password.data):
-        flash("Unauthorized!", 'danger')
+    if form.validate_on_submit():
+        if not User.authenticate(g.user.username, form.password.data):
+            flash("Unauthorized!", 'danger')
+            return render_template("users/edit.html", form=form)
 
-    if form.validate_on_submit() and User.authenticate(g.user.username, form.password.data):
         g.user.username = form.username.data
         g.user.email = form.email.data
         g.user.image_url = form.image_url.data or User.image_url.default.arg
@@ -232,12 +513,14 @@ def profile():
         g.user.bio = form.bio.data
 
         db.session.commit()
+        user_cache().invalidate(g.user.id)
+        username_index().add(g.user.id, g.user.username)
         return redirect(f"/users/{g.user.id}")
 
     return render_template("users/edit.html", form=form)
 
 
-@app.route('/users/delete', methods=["POST"])
+@bp.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -250,8 +533,14 @@ def delete_user():
 
         do_logout()
 
+        user_id = g.user.id
+        related_ids = g.user.release_follow_counts()
+        user_cache().invalidate(user_id, *related_ids)
+        liked_ids_cache().invalidate(user_id)
+        followed_celebrities_cache().invalidate(user_id)
         db.session.delete(g.user)
         db.session.commit()
+        username_index().remove(user_id)
 
         return redirect("/signup")
 
@@ -260,7 +549,7 @@ def delete_user():
 # Messages routes:
 
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -274,26 +563,32 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        # added directly: appending to g.user.messages would load every
+        # message the user has posted
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        g.user.messages_count = User.messages_count + 1
+        db.session.flush()
+        timeline.fan_out(msg)
         db.session.commit()
+        user_cache().invalidate(g.user.id)
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@bp.route('/messages/<int:message_id>', methods=["GET"])
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
-    liked_msg_ids = [lm.id for lm in g.user.liked_messages]
+    msg = Message.query.options(joinedload(Message.user)).get_or_404(message_id)
+    liked_msg_ids = liked_ids([msg])
 
     return render_template('messages/show.html', message=msg, likes=liked_msg_ids)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@bp.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -305,8 +600,10 @@ def messages_destroy(message_id):
 
     if form.validate_on_submit():
         msg = Message.query.get(message_id)
+        msg.user.messages_count = User.messages_count - 1
         db.session.delete(msg)
         db.session.commit()
+        user_cache().invalidate(msg.user_id)
 
         return redirect(f"/users/{g.user.id}")
     
@@ -318,50 +615,78 @@ def messages_destroy(message_id):
 # Like routes:
 
 
-def _handle_like_unlike(message_id, user_id):
-    """ helper function that handles liking or unliking messages"""
+def _handle_like_unlike(message_id, liked=None):
+    """Like message `message_id` for the current user, or unlike it if
+    `liked` is False. With `liked` None, unlike it if they already do, else
+    like it. Returns True if it's now liked, or None (changing nothing) if
+    it's their own message.
+    """
 
-    user_likes_ids = [lm.id for lm in g.user.liked_messages] 
-    is_liked = message_id in user_likes_ids 
-    msg = Message.query.get_or_404(message_id)
+    author_id = db.session.execute(
+        select(Message.user_id).where(Message.id == message_id)).scalar()
 
-    # TODO create model methods for logic here
-    
-    if msg.user_id == g.user.id:
-        flash("Sorry, you cannot like your own message!", 'danger')
-        return redirect(f"/users/{g.user.id}")
-        
-    if is_liked:
-        g.user.liked_messages.remove(msg)
-        flash("message unliked!", 'danger')
+    if author_id is None:
+        abort(404)
 
+    if author_id == g.user.id:
+        return None
+
+    if liked is None:
+        liked = g.user.toggle_like(message_id)
     else:
-        g.user.liked_messages.append(msg)
-        flash("message liked!", 'success')
+        g.user.set_like(message_id, liked)
 
     db.session.commit()
+    user_cache().invalidate(g.user.id)
+    liked_ids_cache().update(g.user.id, message_id, liked)
+
+    return liked
 
 
-@app.route("/messages/<int:message_id>/like", methods=["POST"])
+@bp.route("/messages/<int:message_id>/like", methods=["POST"])
 def handle_message_like_unlike(message_id):
-    """ handles the different routes for liking/unliking messages """
+    """ handles the different routes for liking/unliking messages
+
+    The form's 'like' field says which: 1 to like, 0 to unlike (so a page
+    showing a stale star can't undo what it means to do); without it, the
+    like is toggled. Clients that ask for JSON get {"message_id", "liked",
+    "likes_count"} back instead of a redirect.
+    """
 
     if not g.user:
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
 
     form = ForValidationForm()
     # route = request.form["route"]
     referrer = request.referrer
     if form.validate_on_submit():
-        _handle_like_unlike(message_id, g.user.id)
+        like = request.form.get('like')
+        liked = _handle_like_unlike(message_id,
+                                    liked=None if like is None else like == '1')
+
+        if wants_json():
+            if liked is None:
+                return jsonify(error="Sorry, you cannot like your own message!"), 403
+
+            return jsonify(message_id=message_id,
+                           liked=liked,
+                           likes_count=g.user.likes_count)
+
+        if liked is None:
+            flash("Sorry, you cannot like your own message!", 'danger')
+            return redirect(f"/users/{g.user.id}")
+
+        if liked:
+            flash("message liked!", 'success')
+        else:
+            flash("message unliked!", 'danger')
 
         if referrer:
             return redirect(referrer)
 
         return redirect("/")
 
-@app.route('/users/<int:user_id>/likes')
+@bp.route('/users/<int:user_id>/likes')
 def show_user_likes(user_id):
     """If user is not logged in, redirect to homepage
         else, render template for list of user-liked messages """
@@ -372,39 +697,95 @@ def show_user_likes(user_id):
 
     # TODO handle authoriztion for this route
     # TODO be able to see likes of other users when go to their profile
-    return render_template('users/likes.html')
+    messages = (Message
+                .query
+                .options(joinedload(Message.user))
+                .join(Like, Like.message_id == Message.id)
+                .filter(Like.user_id == g.user.id)
+                .yield_per(STREAM_BATCH_SIZE))
+
+    return stream_page('users/likes.html', messages=messages)
 
 
 ##############################################################################
 # Homepage and error pages
 
 
-@app.route('/')
+@bp.route('/')
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: first page of the most recent messages of followed_users
        with stars beside favorited messages
     """
-    
+
     if g.user:
-        following_ids = [u.id for u in g.user.following]
-        messages = (Message
-                    .query
-                    .filter((Message.user_id.in_(following_ids)) | (Message.user_id == g.user.id))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+        page = timeline.home_timeline(
+            g.user, limit=current_app.config['TIMELINE_PAGE_SIZE'])
 
-        liked_msg_ids = {lm.id for lm in g.user.liked_messages}
+        liked_msg_ids = liked_ids(page.items)
 
-        return render_template('home.html', messages=messages, liked_msg_ids = liked_msg_ids)
+        return render_template('home.html', page=page, liked_msg_ids=liked_msg_ids)
 
     else:
         return render_template('home-anon.html')
 
 
+@bp.route('/timeline')
+def home_timeline_page():
+    """Return the next page of the home timeline as an HTML fragment.
+
+    Takes the cursor from the previous page in the 'before' param; used for
+    infinite scroll on the homepage.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    page = timeline.home_timeline(
+        g.user,
+        limit=current_app.config['TIMELINE_PAGE_SIZE'],
+        before=cursor_arg(datetime, int))
+
+    liked_msg_ids = liked_ids(page.items)
+
+    return render_template('home-timeline.html', page=page, liked_msg_ids=liked_msg_ids)
+
+
+@bp.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Rebuild every user's home timeline from messages and follows."""
+
+    timeline.rebuild()
+    db.session.commit()
+
+
+@bp.cli.command('bcrypt-benchmark')
+@click.option('--min-rounds', default=10, help="Lowest cost to try.")
+@click.option('--max-rounds', default=14, help="Highest cost to try.")
+@click.option('--seconds', default=2.0, help="Time to spend on each cost.")
+def bcrypt_benchmark(min_rounds, max_rounds, seconds):
+    """Report logins per second per core at each bcrypt cost."""
+
+    current = current_app.config['BCRYPT_LOG_ROUNDS']
+
+    for rounds in range(min_rounds, max_rounds + 1):
+        rate = credentials.benchmark(bcrypt, rounds, seconds)
+        marker = "  <- BCRYPT_LOG_ROUNDS" if rounds == current else ""
+        click.echo(f"rounds={rounds:2}: {rate:8.1f} logins/s per core "
+                   f"({1000 / rate:7.1f} ms each){marker}")
+
+
+@bp.cli.command('recount')
+def recount():
+    """Recompute every user's message/following/follower/like counts."""
+
+    User.recount()
+    db.session.commit()
+
+
 ##############################################################################
 # Turn off all caching in Flask
 #   (useful for dev; in production, this kind of stuff is typically
@@ -412,10 +793,13 @@ def homepage():
 #
 # https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
 
-@app.after_request
+@bp.after_app_request
 def add_header(response):
     """Add non-caching headers on every request."""
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
     response.cache_control.no_store = True
     return response
+
+
+app = create_app()
@@ -0,0 +1,127 @@
+"""In-memory username index for the search box's autocomplete.
+
+Each worker keeps every username in a sorted array, so the usernames
+starting with a prefix are found with a binary search and no database
+round trip. The index is loaded from the users table on first use, then
+kept current by signup, profile renames and user deletion. Changes made
+by other workers are picked up when it's reloaded, once it's older than
+AUTOCOMPLETE_RELOAD_SECONDS.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, User
+
+
+class PrefixIndex:
+    """Usernames sorted case-insensitively, searchable by prefix."""
+
+    def __init__(self):
+        self._keys = []
+        self._names = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at = None
+
+    def load(self, rows):
+        """Replace the index with (id, username) `rows`."""
+
+        names = {}
+        ids = {}
+        keys = []
+
+        for user_id, username in rows:
+            key = (username.lower(), user_id)
+            keys.append(key)
+            names[key] = username
+            ids[user_id] = key
+
+        keys.sort()
+
+        with self._lock:
+            self._keys, self._names, self._ids = keys, names, ids
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self, max_age):
+        """Was the index loaded over `max_age` seconds ago, or never?"""
+
+        return not self.loaded or time.monotonic() - self.loaded_at > max_age
+
+    def add(self, user_id, username):
+        """Index `username` for `user_id`, replacing any earlier name."""
+
+        with self._lock:
+            self._remove(user_id)
+            key = (username.lower(), user_id)
+            insort(self._keys, key)
+            self._names[key] = username
+            self._ids[user_id] = key
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id):
+        key = self._ids.pop(user_id, None)
+
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+            del self._names[key]
+
+    def search(self, prefix, limit=10):
+        """Return up to `limit` (id, username) starting with `prefix`."""
+
+        prefix = prefix.lower()
+        matches = []
+
+        with self._lock:
+            i = bisect_left(self._keys, (prefix,))
+
+            while i < len(self._keys) and len(matches) < limit:
+                key = self._keys[i]
+
+                if not key[0].startswith(prefix):
+                    break
+
+                matches.append((key[1], self._names[key]))
+                i += 1
+
+        return matches
+
+
+def init_app(app):
+    """Give `app` an (empty) username index; see username_index()."""
+
+    app.config.setdefault('AUTOCOMPLETE_RELOAD_SECONDS', 300)
+    app.extensions['username_index'] = PrefixIndex()
+
+
+_load_lock = threading.Lock()
+
+
+def username_index():
+    """The current app's username index, loaded on first use and reloaded
+    once it's older than AUTOCOMPLETE_RELOAD_SECONDS.
+    """
+
+    index = current_app.extensions['username_index']
+    max_age = current_app.config['AUTOCOMPLETE_RELOAD_SECONDS']
+
+    # the first load is waited for; while a reload runs, other threads
+    # carry on with the old index
+    if index.is_stale(max_age) and _load_lock.acquire(blocking=not index.loaded):
+        try:
+            if index.is_stale(max_age):
+                index.load(db.session.execute(
+                    select(User.id, User.username)).all())
+        finally:
+            _load_lock.release()
+
+    return index
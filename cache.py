@@ -0,0 +1,266 @@
+"""Caches for Warbler.
+
+Values live in a CacheBackend. The default, LRUCache, is in-process, so
+each worker has its own copy and an invalidation only reaches the worker
+that made it (entries elsewhere live out their TTL). To share entries
+across workers, write a backend over a shared store (Redis, memcached...)
+and pass it to init_app(); cached values are plain dicts/lists of ints and
+strings, so they serialize easily.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import db, Like, User
+
+
+class CacheBackend:
+    """Interface for cache storage."""
+
+    def get(self, key):
+        """Return the value stored for `key`, or None."""
+
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """Store `value` for `key`."""
+
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        """Drop `keys`, if present."""
+
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process cache holding up to `maxsize` entries, each
+    for at most `ttl` seconds; the least recently used go first.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires, value = entry
+
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class UserCache:
+    """Read-through cache of `users` rows, keyed by id.
+
+    Saves the query for the logged-in user that nearly every request makes.
+    Rows are cached as column dicts and re-attached to the session without
+    a query, so relationships still lazy-load and changes still flush as
+    usual. Anything that changes a user row must call invalidate().
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(user_id):
+        return f"user:{user_id}"
+
+    def get(self, user_id):
+        """Return the User with `user_id` (None if there's no such user)."""
+
+        row = self.backend.get(self._key(user_id))
+
+        if row is None:
+            # select the row itself rather than User.query.get(), which
+            # could hand back a partly-loaded (load_only) instance
+            row = db.session.execute(
+                select(User.__table__).where(User.id == user_id)
+            ).mappings().first()
+
+            if row is None:
+                return None
+
+            row = dict(row)
+            self.backend.set(self._key(user_id), row)
+
+        user = User(**row)
+        make_transient_to_detached(user)
+
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, *user_ids):
+        """Drop the cached rows of `user_ids`."""
+
+        self.backend.delete(*(self._key(user_id) for user_id in user_ids))
+
+
+class LikedIdsCache:
+    """Read-through cache of the ids of the messages each user likes.
+
+    Ids are kept as a sorted list of ints, so checking the messages on a
+    page is a binary search per message rather than loading every liked
+    message. Users with more than `max_likes` likes aren't cached; their
+    pages are checked with one IN query over the page's message ids.
+    Liking and unliking must call update().
+    """
+
+    def __init__(self, backend, max_likes=10000):
+        self.backend = backend
+        self.max_likes = max_likes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id):
+        return f"liked:{user_id}"
+
+    def liked(self, user, message_ids):
+        """Return the set of `message_ids` that `user` likes."""
+
+        if not message_ids:
+            return set()
+
+        ids = self.backend.get(self._key(user.id))
+
+        if ids is None and user.likes_count <= self.max_likes:
+            ids = list(db.session.execute(
+                select(Like.message_id)
+                .where(Like.user_id == user.id)
+                .order_by(Like.message_id)
+            ).scalars())
+            self.backend.set(self._key(user.id), ids)
+
+        if ids is None:
+            return set(db.session.execute(
+                select(Like.message_id)
+                .where(Like.user_id == user.id)
+                .where(Like.message_id.in_(message_ids))
+            ).scalars())
+
+        return {message_id for message_id in message_ids
+                if _contains(ids, message_id)}
+
+    def update(self, user_id, message_id, liked):
+        """Record that `user_id` now does (or doesn't) like `message_id`."""
+
+        # held across the get and set, so concurrent updates don't drop one
+        # another (within this process; other workers' copies expire)
+        with self._lock:
+            ids = self.backend.get(self._key(user_id))
+
+            if ids is None or _contains(ids, message_id) == liked:
+                return
+
+            # copy, since other threads may be reading the cached list
+            ids = list(ids)
+
+            if liked:
+                insort(ids, message_id)
+            else:
+                del ids[bisect_left(ids, message_id)]
+
+            self.backend.set(self._key(user_id), ids)
+
+    def invalidate(self, *user_ids):
+        """Drop the cached ids of `user_ids`."""
+
+        self.backend.delete(*(self._key(user_id) for user_id in user_ids))
+
+
+class FollowedCelebritiesCache:
+    """Cache of the ids of the celebrities (see timeline.py) each user
+    follows, so reading a home timeline doesn't scan the reader's follows.
+
+    Following and unfollowing must call invalidate(). An account that
+    crosses the fan-out threshold is picked up as entries expire.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(user_id):
+        return f"celebrities:{user_id}"
+
+    def get(self, user_id):
+        """Return the cached ids for `user_id`, or None."""
+
+        return self.backend.get(self._key(user_id))
+
+    def set(self, user_id, celebrity_ids):
+        self.backend.set(self._key(user_id), list(celebrity_ids))
+
+    def invalidate(self, *user_ids):
+        """Drop the cached ids of `user_ids`."""
+
+        self.backend.delete(*(self._key(user_id) for user_id in user_ids))
+
+
+def _contains(sorted_ids, value):
+    i = bisect_left(sorted_ids, value)
+    return i < len(sorted_ids) and sorted_ids[i] == value
+
+
+def init_app(app, backend=None):
+    """Give `app` a UserCache, a LikedIdsCache and a
+    FollowedCelebritiesCache, stored in `backend` (default: an LRUCache
+    sized by the USER_CACHE_SIZE and USER_CACHE_TTL config).
+    LIKED_IDS_CACHE_MAX caps the likes a user can have and still be cached.
+    """
+
+    if backend is None:
+        backend = LRUCache(maxsize=app.config.setdefault('USER_CACHE_SIZE', 10000),
+                           ttl=app.config.setdefault('USER_CACHE_TTL', 60))
+
+    app.extensions['user_cache'] = UserCache(backend)
+    app.extensions['liked_ids_cache'] = LikedIdsCache(
+        backend, max_likes=app.config.setdefault('LIKED_IDS_CACHE_MAX', 10000))
+    app.extensions['followed_celebrities_cache'] = FollowedCelebritiesCache(backend)
+
+
+def user_cache():
+    """The current app's UserCache."""
+
+    return current_app.extensions['user_cache']
+
+
+def liked_ids_cache():
+    """The current app's LikedIdsCache."""
+
+    return current_app.extensions['liked_ids_cache']
+
+
+def followed_celebrities_cache():
+    """The current app's FollowedCelebritiesCache."""
+
+    return current_app.extensions['followed_celebrities_cache']
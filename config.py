@@ -0,0 +1,94 @@
+"""Configuration profiles for Warbler.
+
+create_app() picks one by name, from the WARBLER_ENV environment variable
+if it isn't given one: 'dev' (the default), 'test' or 'prod'.
+"""
+
+import os
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    # Get DB_URI from environ variable (useful for production/testing) or,
+    # if not set there, use development local db.
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///warbler')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+
+    # bcrypt work factor for new password hashes; each step doubles the CPU
+    # a login costs (see `flask bcrypt-benchmark`). Older hashes are
+    # upgraded when their owners next log in.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+    # Only the dev profile loads flask_debugtoolbar at all (and it only
+    # shows itself when the app runs in debug mode).
+    DEBUG_TOOLBAR = False
+
+    # Users with more followers than this aren't fanned out to timelines on
+    # write; their messages are merged into followers' timelines on read.
+    TIMELINE_FANOUT_THRESHOLD = int(os.environ.get('TIMELINE_FANOUT_THRESHOLD', 10000))
+    TIMELINE_PAGE_SIZE = 20
+    PROFILE_PAGE_SIZE = 20
+
+    USERS_PAGE_SIZE = 30
+    FOLLOWS_PAGE_SIZE = 30
+    AUTOCOMPLETE_LIMIT = 10
+
+
+class DevConfig(Config):
+    """Local development: SQL echo and the debug toolbar."""
+
+    SQLALCHEMY_ECHO = True
+    DEBUG_TOOLBAR = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = True
+
+
+class TestConfig(Config):
+    """The test suite."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///warbler-test')
+    TESTING = True
+    BCRYPT_LOG_ROUNDS = 4
+
+
+class ProdConfig(Config):
+    """Production: no debug tooling, and a sized connection pool. Needs a
+    SECRET_KEY in the environment.
+    """
+
+    # no fallback: sessions signed with a well-known key can be forged
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+    }
+
+
+PROFILES = {
+    'dev': DevConfig,
+    'test': TestConfig,
+    'prod': ProdConfig,
+}
+
+
+def get_config(profile=None):
+    """Return the config class for `profile` (default: $WARBLER_ENV or dev)."""
+
+    profile = profile or os.environ.get('WARBLER_ENV', 'dev')
+
+    try:
+        config = PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f"Unknown config profile {profile!r}; use one of {', '.join(PROFILES)}")
+
+    if not config.SECRET_KEY:
+        raise ValueError(f"The {profile!r} config profile needs SECRET_KEY set in the environment")
+
+    return config
@@ -0,0 +1,133 @@
+"""Password hashing for Warbler, on a bounded pool of worker threads.
+
+bcrypt is slow on purpose, so a burst of logins or signups can take every
+request thread hostage. All hashing and checking goes through a
+CredentialService instead: at most BCRYPT_WORKERS hashes run at once
+(bcrypt releases the GIL, so they do run in parallel), at most
+BCRYPT_MAX_PENDING more wait for a worker, and anything beyond that is
+refused with CredentialsBusy -- the app answers 503 -- rather than queued
+behind work it can't get to in time.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+
+class CredentialsBusy(Exception):
+    """Raised when the hashing pool is full; the caller should retry later."""
+
+
+class _HashingPool:
+    """One app's hashing threads, queue bound and bcrypt cost."""
+
+    def __init__(self, rounds, workers, max_pending):
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='bcrypt')
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+
+
+class CredentialService:
+    """Hashes and checks passwords with `bcrypt` (a flask_bcrypt.Bcrypt) on
+    a bounded thread pool; see init_app().
+
+    Each app gets its own pool and cost, kept in its extensions. Outside
+    an app context, the service uses `app` (like db.app) if it's set.
+    """
+
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self.app = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Size `app`'s pool from its BCRYPT_WORKERS (default: one per CPU)
+        and BCRYPT_MAX_PENDING config, and hash at its BCRYPT_LOG_ROUNDS.
+        """
+
+        rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        workers = app.config.setdefault('BCRYPT_WORKERS', os.cpu_count() or 1)
+        max_pending = app.config.setdefault('BCRYPT_MAX_PENDING', 4 * workers)
+
+        previous = app.extensions.get('credentials')
+
+        if previous is not None:
+            previous.executor.shutdown(wait=False)
+
+        app.extensions['credentials'] = _HashingPool(rounds, workers, max_pending)
+
+    @property
+    def _pool(self):
+        app = current_app if has_app_context() else self.app
+
+        if app is None:
+            raise RuntimeError("CredentialService used outside an app context, "
+                               "with no default app")
+
+        return app.extensions['credentials']
+
+    @property
+    def rounds(self):
+        """The bcrypt cost new hashes are made at."""
+
+        return self._pool.rounds
+
+    def _run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for the result."""
+
+        pool = self._pool
+
+        if not pool.slots.acquire(blocking=False):
+            raise CredentialsBusy()
+
+        try:
+            future = pool.executor.submit(fn, *args)
+        except BaseException:
+            pool.slots.release()
+            raise
+
+        future.add_done_callback(lambda _: pool.slots.release())
+
+        return future.result()
+
+    def hash(self, password):
+        """Return the bcrypt hash of `password`, as a string."""
+
+        return self._run(self.bcrypt.generate_password_hash,
+                         password, self.rounds).decode('UTF-8')
+
+    def check(self, pw_hash, password):
+        """Does `password` match `pw_hash`?"""
+
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Was `pw_hash` made at a different cost than we hash at now?"""
+
+        # bcrypt hashes look like $2b$12$<salt and hash>
+        try:
+            return int(pw_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+def benchmark(bcrypt, rounds, seconds=2.0):
+    """Return how many password checks per second one core does at
+    `rounds`, measured for about `seconds`.
+    """
+
+    pw_hash = bcrypt.generate_password_hash('benchmark', rounds)
+    checks = 0
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < seconds:
+        bcrypt.check_password_hash(pw_hash, 'benchmark')
+        checks += 1
+
+    return checks / (time.perf_counter() - start)
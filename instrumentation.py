@@ -0,0 +1,182 @@
+"""SQL instrumentation for Warbler.
+
+Counts the statements run against the database:
+
+- per request, reported in a `Server-Timing` response header and a
+  structured log line (see init_app), so hot routes can be found without
+  turning on SQLALCHEMY_ECHO;
+- per block, so tests can hold each page to a query budget and catch N+1
+  lazy loads creeping back in (see max_queries).
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('warbler.sql')
+
+
+class RequestSQLStats:
+    """SQL statement count, total time and slowest statement of a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+
+        if elapsed >= self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+
+    if has_request_context() and '_sql_stats' in g:
+        g._sql_stats.record(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    # a statement that raised never reaches after_cursor_execute
+    conn = exception_context.connection
+
+    if conn is not None and conn.info.get('query_start_time'):
+        conn.info['query_start_time'].pop()
+
+
+def _instrument(engine):
+    """Time the statements run on `engine` (once, however often called)."""
+
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+
+def _start_request_stats():
+    g._sql_stats = RequestSQLStats()
+    g._request_start_time = time.perf_counter()
+
+
+def _report_request_stats(response):
+    stats = g.get('_sql_stats')
+
+    if stats is None:
+        return response
+
+    start = g._request_start_time
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+    }
+
+    def log():
+        logger.info(json.dumps({
+            **record,
+            'queries': stats.count,
+            'db_ms': round(stats.total * 1000, 1),
+            'slowest_ms': round(stats.slowest * 1000, 1),
+            'slowest_statement': stats.slowest_statement,
+            'total_ms': round((time.perf_counter() - start) * 1000, 1),
+        }))
+
+    if response.is_streamed:
+        # the body (and its queries) hasn't run yet: log once it's sent,
+        # and leave out the header, which would undercount
+        response.call_on_close(log)
+        return response
+
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"')
+    response.headers.add(
+        'Server-Timing', f'app;dur={(time.perf_counter() - start) * 1000:.1f}')
+    log()
+
+    return response
+
+
+def init_app(app, db):
+    """Time the SQL statements `app` runs on `db`'s engine, and report the
+    totals for each request when its SQL_STATS config is on (the default).
+    """
+
+    if not logger.handlers:
+        logger.addHandler(default_handler)
+        logger.setLevel(logging.INFO)
+
+    if not app.config.setdefault('SQL_STATS', True):
+        return
+
+    with app.app_context():
+        _instrument(db.engine)
+
+    @app.before_request
+    def start_request_stats():
+        # Flask-SQLAlchemy replaces the engine if its config changes
+        _instrument(db.engine)
+        _start_request_stats()
+
+    app.after_request(_report_request_stats)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A block ran more SQL statements than its budget allows."""
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it's active."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+@contextmanager
+def max_queries(budget):
+    """Fail with QueryBudgetExceeded if the block runs over `budget` queries.
+
+        with max_queries(5):
+            client.get("/")
+    """
+
+    with QueryCounter() as counter:
+        yield counter
+
+    if counter.count > budget:
+        raise QueryBudgetExceeded(
+            f"{counter.count} queries run, budget is {budget}:\n"
+            + "\n".join(counter.statements))
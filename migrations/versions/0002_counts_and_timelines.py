@@ -0,0 +1,47 @@
+"""Denormalized user counts and materialized home timelines
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:00:00
+
+Adds the users.*_count columns and the timeline_entries table. Both start
+out empty (the counts at 0), so an existing database must be filled in
+after upgrading past this revision:
+
+    flask recount
+    flask rebuild-timelines
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+COUNTS = ['messages_count', 'following_count', 'followers_count', 'likes_count']
+
+
+def upgrade():
+    for name in COUNTS:
+        op.add_column('users', sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    op.create_table(
+        'timeline_entries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='cascade'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('user_id', 'message_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('timeline_entries')
+
+    for name in reversed(COUNTS):
+        op.drop_column('users', name)
@@ -0,0 +1,64 @@
+"""Indexes for the timeline, profile, follows, likes and search queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:00:00
+
+On PostgreSQL each index is built with CREATE INDEX CONCURRENTLY, which
+doesn't block writes to the table, so this can run against a live
+database. CONCURRENTLY can't run in a transaction, hence the autocommit
+block. A build that fails leaves an INVALID index behind; drop it and
+run the upgrade again (IF NOT EXISTS would otherwise skip it).
+
+The username trigram index is skipped on servers without the pg_trgm
+contrib module (search then falls back to substring scans). To add it
+later, install the module, then downgrade to 0002 and upgrade again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns) -- these match the db.Index declarations in models.py
+INDEXES = [
+    ('ix_messages_user_id_timestamp', 'messages', ['user_id', 'timestamp', 'id']),
+    ('ix_likes_message_id', 'likes', ['message_id']),
+    ('ix_follows_user_following_id', 'follows', ['user_following_id', 'user_being_followed_id']),
+    ('ix_timeline_entries_user_id_timestamp', 'timeline_entries', ['user_id', 'timestamp', 'message_id']),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                       f"ON {table} ({', '.join(columns)})")
+
+        # username search (see search.py), if the server has pg_trgm
+        if op.get_bind().execute(sa.text(
+                "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_trgm "
+                       "ON users USING gin (username gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES + [('ix_users_username_trgm', 'users', None)]:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -3,12 +3,39 @@
 from datetime import datetime
 
 from flask_bcrypt import Bcrypt
+from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, delete, event, func, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from credentials import CredentialService
+import instrumentation
+from pagination import make_page
 
 bcrypt = Bcrypt()
+credentials = CredentialService(bcrypt)
 db = SQLAlchemy()
 
 
+def _include_in_migrations(obj, name, type_, reflected, compare_to):
+    """Leave the trigram index (created with DDL, see below) out of
+    migration autogenerate/check, which only knows declared indexes.
+    """
+
+    return not (type_ == 'index' and name == 'ix_users_username_trgm')
+
+
+migrate = Migrate(include_object=_include_in_migrations)
+
+
+def _insert_ignoring_conflicts(model):
+    """INSERT ... ON CONFLICT DO NOTHING into `model`'s table."""
+
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+
+    return insert(model).on_conflict_do_nothing()
+
+
 class Follows(db.Model):
     """Connection of a follower <-> followed_user."""
 
@@ -26,6 +53,48 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # The primary key covers a user's followers in order; this covers the
+    # users they follow, so both lists page off an index.
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
+    @classmethod
+    def exists(cls, follower, followed):
+        """Does `follower` follow `followed`? (a primary key lookup)"""
+
+        return db.session.execute(
+            select(
+                select(cls.user_following_id)
+                .where(cls.user_being_followed_id == followed.id)
+                .where(cls.user_following_id == follower.id)
+                .exists())
+        ).scalar()
+
+    @classmethod
+    def add(cls, follower_id, followed_id):
+        """Record that `follower_id` follows `followed_id`, unless they
+        already do. Returns True if a follow was added.
+        """
+
+        return db.session.execute(
+            _insert_ignoring_conflicts(cls)
+            .values(user_following_id=follower_id, user_being_followed_id=followed_id)
+        ).rowcount == 1
+
+    @classmethod
+    def remove(cls, follower_id, followed_id):
+        """Drop `follower_id`'s follow of `followed_id`. Returns True if
+        there was one.
+        """
+
+        return db.session.execute(
+            delete(cls)
+            .where(cls.user_following_id == follower_id)
+            .where(cls.user_being_followed_id == followed_id)
+        ).rowcount == 1
+
 
 class User(db.Model):
     """User in the system."""
@@ -74,6 +143,38 @@ class User(db.Model):
         nullable=False,
     )
 
+    # Denormalized counts, kept in step by the routes that change them (see
+    # follow/unfollow and app.py) so pages don't load whole collections just
+    # to count them. `flask recount` repairs any drift.
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
     messages = db.relationship('Message', order_by='Message.timestamp.desc()')
     
     liked_messages = db.relationship(
@@ -100,14 +201,143 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.exists(follower=other_user, followed=self)
 
     def is_following(self, other_user):
         """Is this user following `other_use`?"""
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return Follows.exists(follower=self, followed=other_user)
+
+    def following_ids(self):
+        """Set of ids of the users this user follows, in one query.
+
+        For pages that check follow state for many users at once.
+        """
+
+        return set(db.session.execute(
+            select(Follows.user_being_followed_id)
+            .where(Follows.user_following_id == self.id)
+        ).scalars())
+
+    def follow(self, other_user):
+        """Follow `other_user`, updating both users' counts. Returns True if
+        this is a new follow (False if it already existed, or if
+        `other_user` is this user).
+
+        Writes the one follows row, however many users this user follows.
+        """
+
+        if other_user.id == self.id or not Follows.add(self.id, other_user.id):
+            return False
+
+        self.following_count = User.following_count + 1
+        other_user.followers_count = User.followers_count + 1
+        return True
+
+    def unfollow(self, other_user):
+        """Stop following `other_user`, updating both users' counts. Returns
+        True if there was a follow to drop.
+        """
+
+        if not Follows.remove(self.id, other_user.id):
+            return False
+
+        self.following_count = User.following_count - 1
+        other_user.followers_count = User.followers_count - 1
+        return True
+
+    def messages_page(self, limit=20, before=None):
+        """Return a Page of this user's messages, newest first.
+
+        Keyed on (timestamp, id), with `before` the key the page starts
+        after, so each page is a range scan of the (user_id, timestamp, id)
+        index however many messages the user has.
+        """
+
+        messages = (Message
+                    .query
+                    .filter(Message.user_id == self.id)
+                    .order_by(Message.timestamp.desc(), Message.id.desc()))
+
+        if before:
+            messages = messages.filter(tuple_(Message.timestamp, Message.id) < before)
+
+        return make_page(messages.limit(limit + 1).all(), limit,
+                         lambda msg: (msg.timestamp, msg.id))
+
+    def toggle_like(self, message_id):
+        """Like message `message_id`, or unlike it if this user already does,
+        keeping likes_count in step. Returns True if it's now liked.
+
+        Works on the one likes row, however many likes the user has.
+        """
+
+        if Like.remove(self.id, message_id):
+            self.likes_count = User.likes_count - 1
+            return False
+
+        if Like.add(self.id, message_id):
+            self.likes_count = User.likes_count + 1
+
+        return True
+
+    def set_like(self, message_id, liked):
+        """Like message `message_id` (or, if not `liked`, unlike it), keeping
+        likes_count in step; already being in that state is fine.
+        """
+
+        if liked and Like.add(self.id, message_id):
+            self.likes_count = User.likes_count + 1
+
+        elif not liked and Like.remove(self.id, message_id):
+            self.likes_count = User.likes_count - 1
+
+    def release_follow_counts(self):
+        """Decrement the counts of everyone this user follows or is followed
+        by; call before deleting the user (the follows cascade away in SQL).
+
+        Returns the ids of the users whose counts changed.
+        """
+
+        followed_ids = self.following_ids()
+        follower_ids = set(db.session.execute(
+            select(Follows.user_following_id)
+            .where(Follows.user_being_followed_id == self.id)
+        ).scalars())
+
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(followed_ids))
+            .values(followers_count=User.followers_count - 1)
+            .execution_options(synchronize_session=False))
+
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(follower_ids))
+            .values(following_count=User.following_count - 1)
+            .execution_options(synchronize_session=False))
+
+        return followed_ids | follower_ids
+
+    @classmethod
+    def recount(cls):
+        """Recompute every user's denormalized counts from the source tables."""
+
+        def count(user_id_column):
+            return (select(func.count())
+                    .select_from(user_id_column.table)
+                    .where(user_id_column == cls.id)
+                    .scalar_subquery())
+
+        db.session.execute(
+            update(cls)
+            .values(
+                messages_count=count(Message.user_id),
+                following_count=count(Follows.user_following_id),
+                followers_count=count(Follows.user_being_followed_id),
+                likes_count=count(Like.user_id),
+            )
+            .execution_options(synchronize_session=False))
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -116,7 +346,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = credentials.hash(password)
 
         user = User(
             username=username,
@@ -137,18 +367,50 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        A password hashed at an older cost is rehashed at the current one;
+        the caller commits the change.
         """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = credentials.check(user.password, password)
             if is_auth:
+                if credentials.needs_rehash(user.password):
+                    user.password = credentials.hash(password)
                 return user
 
         return False
 
 
+def _trigram_installable(ddl, target, bind, **kw):
+    """Is `bind` a PostgreSQL server with the pg_trgm contrib module? (An
+    execute_if() test; without it, search falls back to substring scans.)
+    """
+
+    return (bind.dialect.name == 'postgresql'
+            and bind.execute(text(
+                "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            ).first() is not None)
+
+
+# Trigram index for username search (see search.py). PostgreSQL only (and
+# only with pg_trgm), so it's created with DDL rather than declared as a
+# db.Index.
+event.listen(
+    User.__table__,
+    'after_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(callable_=_trigram_installable))
+USERNAME_TRGM_INDEX = DDL("CREATE INDEX ix_users_username_trgm ON users "
+                          "USING gin (username gin_trgm_ops)")
+
+event.listen(
+    User.__table__,
+    'after_create',
+    USERNAME_TRGM_INDEX.execute_if(callable_=_trigram_installable))
+
+
 class Message(db.Model):
     """An individual message ("warble")."""
 
@@ -178,6 +440,10 @@ class Message(db.Model):
 
     user = db.relationship('User')
 
+    __table_args__ = (
+        db.Index('ix_messages_user_id_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         return f"<Message {self.id}, {self.text}, {self.timestamp}, {self.user_id}>"
 
@@ -199,9 +465,73 @@ class Like(db.Model):
         db.ForeignKey('messages.id'),
         primary_key=True)
 
+    # the primary key leads with user_id; this finds a message's likes
+    __table_args__ = (
+        db.Index('ix_likes_message_id', 'message_id'),
+    )
+
     def __repr__(self):
         return f"<Like {self.user_id} {self.message_id}>"
 
+    @classmethod
+    def add(cls, user_id, message_id):
+        """Record that `user_id` likes `message_id`, unless they already do
+        (INSERT ... ON CONFLICT DO NOTHING). Returns True if a like was added.
+        """
+
+        return db.session.execute(
+            _insert_ignoring_conflicts(cls)
+            .values(user_id=user_id, message_id=message_id)
+        ).rowcount == 1
+
+    @classmethod
+    def remove(cls, user_id, message_id):
+        """Drop `user_id`'s like of `message_id`. Returns True if there was one."""
+
+        return db.session.execute(
+            delete(cls)
+            .where(cls.user_id == user_id)
+            .where(cls.message_id == message_id)
+        ).rowcount == 1
+
+
+class TimelineEntry(db.Model):
+    """A message delivered to a user's home timeline.
+
+    Rows are written when a message is posted (fan-out-on-write), so a home
+    timeline is read with a single range scan of the
+    (user_id, timestamp, message_id) index instead of a query over everyone
+    followed.
+    """
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    # copy of Message.timestamp, so the timeline can be paged off the index
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+    )
+
+    def __repr__(self):
+        return f"<TimelineEntry {self.user_id} {self.message_id}>"
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
@@ -211,3 +541,8 @@ def connect_db(app):
 
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db)
+    bcrypt.init_app(app)
+    credentials.app = app
+    credentials.init_app(app)
+    instrumentation.init_app(app, db)
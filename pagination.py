@@ -0,0 +1,106 @@
+"""Keyset (cursor) pagination helpers for Warbler.
+
+A page is fetched with `WHERE (sort keys) < (cursor) ORDER BY ... LIMIT n`,
+so its cost depends only on the page size, not on how deep the reader has
+scrolled (as it would with OFFSET). The cursor handed to the client is the
+sort key of the last row on the page, packed into an opaque string.
+"""
+
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, request
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+# Rows fetched from the database per round trip when streaming.
+STREAM_BATCH_SIZE = 100
+
+
+def encode_cursor(*values):
+    """Pack sort key `values` (ints, floats, strings, datetimes) in a cursor."""
+
+    packed = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(packed, separators=(',', ':')).encode('utf-8')
+
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """Unpack `cursor`, converting each value with the matching type.
+
+    Use `datetime` for timestamps. Raises ValueError for a bad cursor.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Bad cursor: {cursor!r}") from exc
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError(f"Bad cursor: {cursor!r}")
+
+    try:
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v)
+                     for t, v in zip(types, values))
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Bad cursor: {cursor!r}") from exc
+
+
+def cursor_arg(*types, name='before'):
+    """Decode the cursor in querystring param `name`, or None if absent.
+
+    Aborts with a 400 if the cursor can't be decoded.
+    """
+
+    cursor = request.args.get(name)
+
+    if not cursor:
+        return None
+
+    try:
+        return decode_cursor(cursor, *types)
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def make_page(rows, limit, key):
+    """Build a Page from up to `limit + 1` `rows` fetched in sort order.
+
+    The extra row only signals there is another page; `key(row)` gives the
+    sort key the next page starts after.
+    """
+
+    items = rows[:limit]
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > limit else None
+
+    return Page(items, next_cursor)
+
+
+class StreamedPage:
+    """A page of up to `limit` rows of `query`, fetched in batches while it
+    is iterated (e.g. by a streamed template), so the rows never all sit in
+    memory at once.
+
+    `next_cursor` is only known once iteration has finished.
+    """
+
+    def __init__(self, query, limit, key):
+        self._rows = query.limit(limit + 1).yield_per(STREAM_BATCH_SIZE)
+        self._limit = limit
+        self._key = key
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+
+        for count, row in enumerate(self._rows):
+            if count == self._limit:
+                self.next_cursor = encode_cursor(*self._key(last))
+                break
+
+            last = row
+            yield row
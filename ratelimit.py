@@ -0,0 +1,120 @@
+"""Rate limiting for Warbler's login and signup.
+
+Each attempt costs a bcrypt hash, so both are limited with token buckets:
+one per client IP and one per username. A bucket holds up to `count`
+tokens and refills at `count` per `period` seconds; an attempt takes a
+token, and an attempt that finds its bucket empty is refused with
+RateLimited -- the app answers 429 -- before any password is hashed.
+
+Buckets live in a RateLimitBackend. The default, MemoryBackend, is
+in-process, so each worker limits on its own (a client gets up to
+workers x count attempts). To share buckets across workers, write a
+backend over a shared store and pass it to init_app().
+
+Behind a proxy, the client IP is only right if the app is wrapped in
+werkzeug's ProxyFix.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+
+class RateLimited(Exception):
+    """Raised for an attempt over its limit; try again after `retry_after`
+    seconds.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class RateLimitBackend:
+    """Interface for token bucket storage."""
+
+    def take(self, key, count, period):
+        """Take a token from bucket `key` (holding up to `count` tokens,
+        refilled at `count` per `period` seconds).
+
+        Returns 0 if there was one, else the seconds until there will be.
+        """
+
+        raise NotImplementedError
+
+
+class MemoryBackend(RateLimitBackend):
+    """Thread-safe in-process buckets; past `maxsize` buckets, the least
+    recently used are forgotten (i.e. refilled).
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, count, period):
+        rate = count / period
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (count, now))
+            tokens = min(count, tokens + (now - updated) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+class RateLimiter:
+    """Applies the AUTH_LIMIT_PER_IP and AUTH_LIMIT_PER_USERNAME limits,
+    each a (count, period in seconds) pair, with buckets in `backend`.
+    """
+
+    def __init__(self, backend, per_ip, per_username):
+        self.backend = backend
+        self.per_ip = per_ip
+        self.per_username = per_username
+
+    def limit_auth(self, username):
+        """Count a login or signup attempt for `username` from the current
+        request's IP; raise RateLimited if either is over its limit.
+        """
+
+        for key, (count, period) in (
+                (f"auth:ip:{request.remote_addr}", self.per_ip),
+                (f"auth:user:{username.lower()}", self.per_username)):
+            wait = self.backend.take(key, count, period)
+
+            if wait:
+                raise RateLimited(math.ceil(wait))
+
+
+def init_app(app, backend=None):
+    """Give `app` a RateLimiter, with buckets in `backend` (default: a
+    MemoryBackend).
+    """
+
+    app.extensions['rate_limiter'] = RateLimiter(
+        backend if backend is not None else MemoryBackend(),
+        per_ip=app.config.setdefault('AUTH_LIMIT_PER_IP', (20, 60)),
+        per_username=app.config.setdefault('AUTH_LIMIT_PER_USERNAME', (5, 60)))
+
+
+def rate_limiter():
+    """The current app's RateLimiter."""
+
+    return current_app.extensions['rate_limiter']
@@ -0,0 +1,79 @@
+"""Username search for Warbler.
+
+On PostgreSQL with the pg_trgm extension, searches run against the
+trigram GIN index on users.username (see models.py). They match
+substrings and near-misses, and results are ranked by similarity, so
+latency stays flat as the users table grows. Other backends fall back to
+a case-insensitive substring scan ordered by username.
+
+Either way results come back a page at a time, keyset-paginated on the
+ranking.
+"""
+
+from sqlalchemy import REAL, and_, cast, func, or_, text, tuple_
+
+from models import db, User
+from pagination import decode_cursor, make_page
+
+_trigram_available = {}
+
+
+def trigram_search_available():
+    """Is pg_trgm installed in the database we're connected to?"""
+
+    engine = db.engine
+
+    if engine not in _trigram_available:
+        _trigram_available[engine] = (
+            engine.dialect.name == 'postgresql'
+            and db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None)
+
+    return _trigram_available[engine]
+
+
+def _escape_like(term):
+    return (term.replace('/', '//')
+                .replace('%', '/%')
+                .replace('_', '/_'))
+
+
+def search_users(term, limit=30, cursor=None, query=None):
+    """Return a Page of users whose username matches `term`, best first.
+
+    `cursor` is the next_cursor of the previous page; a bad one raises
+    ValueError. `query` is the User query to search (e.g. with load_only
+    options); by default all of User.
+    """
+
+    query = query if query is not None else User.query
+    contains = User.username.ilike(f"%{_escape_like(term)}%", escape='/')
+
+    if trigram_search_available():
+        rank = func.similarity(User.username, term)
+        query = (query
+                 .add_columns(rank)
+                 .filter(or_(contains, User.username.op('%')(term)))
+                 .order_by(rank.desc(), User.id))
+
+        if cursor:
+            after_rank, after_id = decode_cursor(cursor, float, int)
+            # similarity() is a float4; compared with the cursor's value
+            # as a float8, rows tied with it would be skipped or repeated
+            after_rank = cast(after_rank, REAL)
+            query = query.filter(or_(rank < after_rank,
+                                     and_(rank == after_rank, User.id > after_id)))
+
+        rows = query.limit(limit + 1).all()
+        page = make_page(rows, limit, lambda row: (row[1], row[0].id))
+
+        return page._replace(items=[user for user, _ in page.items])
+
+    query = query.filter(contains).order_by(User.username, User.id)
+
+    if cursor:
+        query = query.filter(tuple_(User.username, User.id) > decode_cursor(cursor, str, int))
+
+    return make_page(query.limit(limit + 1).all(), limit,
+                     lambda user: (user.username, user.id))
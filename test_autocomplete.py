@@ -0,0 +1,76 @@
+"""Username index tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_autocomplete.py
+
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from autocomplete import PrefixIndex
+
+
+class PrefixIndexTestCase(TestCase):
+    """Test the in-memory prefix index."""
+
+    def setUp(self):
+        """Index a few usernames, out of order and in mixed case."""
+
+        self.index = PrefixIndex()
+        self.index.load([(3, "bob"), (1, "Alice"), (2, "alfred"), (4, "Al")])
+
+    def test_load(self):
+        self.assertTrue(self.index.loaded)
+        self.assertFalse(PrefixIndex().loaded)
+
+    def test_is_stale(self):
+        """Is the index stale once older than `max_age`, until reloaded?"""
+
+        self.assertTrue(PrefixIndex().is_stale(300))
+
+        with patch('autocomplete.time.monotonic', return_value=self.index.loaded_at + 300):
+            self.assertFalse(self.index.is_stale(300))
+
+        with patch('autocomplete.time.monotonic', return_value=self.index.loaded_at + 301):
+            self.assertTrue(self.index.is_stale(300))
+            self.index.load([])
+            self.assertFalse(self.index.is_stale(300))
+
+    def test_search(self):
+        """Are matches case-insensitive, in username order, and limited?"""
+
+        self.assertEqual(self.index.search("al"),
+                         [(4, "Al"), (2, "alfred"), (1, "Alice")])
+        self.assertEqual(self.index.search("ALI"), [(1, "Alice")])
+        self.assertEqual(self.index.search("al", limit=2), [(4, "Al"), (2, "alfred")])
+        self.assertEqual(self.index.search("c"), [])
+        self.assertEqual(self.index.search("bobby"), [])
+
+    def test_add(self):
+        self.index.add(5, "Alan")
+
+        self.assertEqual(self.index.search("al"),
+                         [(4, "Al"), (5, "Alan"), (2, "alfred"), (1, "Alice")])
+
+    def test_rename(self):
+        """Does adding a user again replace their old name?"""
+
+        self.index.add(1, "Carol")
+
+        self.assertEqual(self.index.search("ali"), [])
+        self.assertEqual(self.index.search("car"), [(1, "Carol")])
+
+    def test_remove(self):
+        self.index.remove(2)
+        self.index.remove(99)
+
+        self.assertEqual(self.index.search("al"), [(4, "Al"), (1, "Alice")])
+
+    def test_same_name_different_case(self):
+        """Are users whose names differ only in case both kept?"""
+
+        self.index.add(5, "BOB")
+        self.index.remove(3)
+
+        self.assertEqual(self.index.search("bob"), [(5, "BOB")])
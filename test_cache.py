@@ -0,0 +1,137 @@
+"""Cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_cache.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, Follows, Like, Message, User
+from instrumentation import QueryCounter
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+os.environ['WARBLER_ENV'] = "test"
+
+from app import app
+from cache import LRUCache, UserCache
+
+db.create_all()
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the in-process cache backend, on a fake clock."""
+
+    def setUp(self):
+        """Start the clock at 1000 seconds."""
+
+        self.now = 1000.0
+        clock = patch('cache.time.monotonic', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_get_set(self):
+        cache = LRUCache()
+        cache.set("a", {"id": 1})
+
+        self.assertEqual(cache.get("a"), {"id": 1})
+        self.assertIsNone(cache.get("b"))
+
+    def test_ttl(self):
+        """Does an entry expire `ttl` seconds after it was set?"""
+
+        cache = LRUCache(ttl=60)
+        cache.set("a", 1)
+
+        self.now += 60
+        self.assertEqual(cache.get("a"), 1)
+
+        self.now += 1
+        self.assertIsNone(cache.get("a"))
+        self.assertNotIn("a", cache._entries)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_delete(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a", "b", "missing")
+
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+
+class UserCacheTestCase(TestCase):
+    """Test the read-through user cache."""
+
+    def setUp(self):
+        """Add a user; give each test a fresh cache."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.addCleanup(self.ctx.pop)
+        self.addCleanup(db.session.rollback)
+
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        user = User(username="testuser", email="test@test.com",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.cache = UserCache(LRUCache())
+        db.session.expunge_all()
+
+    def test_get_cached(self):
+        """Is the row queried once, then served from the cache?"""
+
+        with QueryCounter() as counter:
+            self.assertEqual(self.cache.get(self.user_id).username, "testuser")
+        self.assertEqual(counter.count, 1)
+
+        db.session.expunge_all()
+
+        with QueryCounter() as counter:
+            user = self.cache.get(self.user_id)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(user.username, "testuser")
+        self.assertIn(user, db.session)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get(self.user_id + 1))
+
+    def test_invalidate(self):
+        """Is a change seen only once the row is invalidated?"""
+
+        self.cache.get(self.user_id)
+        User.query.filter_by(id=self.user_id).update({'username': "renamed"})
+        db.session.commit()
+        db.session.expunge_all()
+
+        self.assertEqual(self.cache.get(self.user_id).username, "testuser")
+
+        db.session.expunge_all()
+        self.cache.invalidate(self.user_id)
+
+        self.assertEqual(self.cache.get(self.user_id).username, "renamed")
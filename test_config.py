@@ -0,0 +1,46 @@
+"""Config profile tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_config.py
+
+
+import importlib
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+import config
+
+
+class GetConfigTestCase(TestCase):
+    """Test picking a config profile."""
+
+    def load_config(self, **environ):
+        """Re-import config.py with `environ` as the environment, for the
+        rest of the test.
+        """
+
+        # cleanups run last-in first-out: restore the environment, then
+        # re-import config.py with it
+        self.addCleanup(importlib.reload, config)
+
+        environ_patch = patch.dict(os.environ, environ, clear=True)
+        environ_patch.start()
+        self.addCleanup(environ_patch.stop)
+
+        return importlib.reload(config)
+
+    def test_profiles(self):
+        cfg = self.load_config()
+
+        self.assertIs(cfg.get_config(), cfg.DevConfig)
+        self.assertIs(cfg.get_config('test'), cfg.TestConfig)
+        self.assertRaises(ValueError, cfg.get_config, 'staging')
+
+    def test_prod_needs_secret_key(self):
+        cfg = self.load_config()
+        self.assertRaises(ValueError, cfg.get_config, 'prod')
+
+        cfg = self.load_config(SECRET_KEY="from the environment")
+        self.assertEqual(cfg.get_config('prod').SECRET_KEY, "from the environment")
@@ -0,0 +1,66 @@
+"""Credential service tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_credentials.py
+
+
+from unittest import TestCase
+
+from flask import Flask
+from flask_bcrypt import Bcrypt
+
+from credentials import CredentialService
+
+
+def make_app(rounds):
+    app = Flask(__name__)
+    app.config['BCRYPT_LOG_ROUNDS'] = rounds
+    app.config['BCRYPT_WORKERS'] = 1
+    return app
+
+
+class CredentialServiceTestCase(TestCase):
+    """Test hashing on per-app pools."""
+
+    def setUp(self):
+        self.credentials = CredentialService(Bcrypt())
+
+    def test_apps_keep_their_own_cost(self):
+        """Does each app hash at its own BCRYPT_LOG_ROUNDS, on its own pool?"""
+
+        fast, slow = make_app(4), make_app(5)
+        self.credentials.init_app(fast)
+        self.credentials.init_app(slow)
+
+        with fast.app_context():
+            pw_hash = self.credentials.hash("password")
+            self.assertTrue(pw_hash.startswith("$2b$04$"))
+            self.assertTrue(self.credentials.check(pw_hash, "password"))
+
+        with slow.app_context():
+            self.assertTrue(self.credentials.hash("password").startswith("$2b$05$"))
+            self.assertTrue(self.credentials.needs_rehash(pw_hash))
+
+        self.assertIsNot(fast.extensions['credentials'], slow.extensions['credentials'])
+
+    def test_default_app(self):
+        """Outside an app context, is the default app's pool used?"""
+
+        app = make_app(4)
+        self.credentials.init_app(app)
+
+        self.assertRaises(RuntimeError, self.credentials.hash, "password")
+
+        self.credentials.app = app
+        self.assertTrue(self.credentials.hash("password").startswith("$2b$04$"))
+
+    def test_init_again_shuts_down_old_pool(self):
+        app = make_app(4)
+        self.credentials.init_app(app)
+        old = app.extensions['credentials']
+
+        self.credentials.init_app(app)
+
+        self.assertIsNot(app.extensions['credentials'], old)
+        self.assertRaises(RuntimeError, old.executor.submit, print)
@@ -0,0 +1,49 @@
+"""SQL instrumentation tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_instrumentation.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import ProgrammingError
+
+from models import db
+import instrumentation
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+os.environ['WARBLER_ENV'] = "test"
+
+from app import app
+
+
+class InstrumentationTestCase(TestCase):
+    """Test the statement timing listeners."""
+
+    def test_only_app_engine_timed(self):
+        with app.app_context():
+            self.assertTrue(event.contains(db.engine, 'before_cursor_execute',
+                                           instrumentation._before_cursor_execute))
+
+        other = create_engine("sqlite://")
+        self.assertFalse(event.contains(other, 'before_cursor_execute',
+                                        instrumentation._before_cursor_execute))
+
+    def test_failed_statement_leaves_no_start_time(self):
+        with app.app_context(), db.engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(ProgrammingError):
+                    conn.execute(text("SELECT no_such_column FROM users"))
+
+            self.assertEqual(conn.info['query_start_time'], [])
+
+            conn.execute(text("SELECT 1"))
+            self.assertEqual(conn.info['query_start_time'], [])
@@ -2,13 +2,16 @@
 
 # run these tests like:
 #
-#    FLASK_ENV=production python -m unittest test_message_views.py
+#    python -m unittest test_message_views.py
 
 
 import os
+from datetime import datetime
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+from models import db, connect_db, Message, User, Like, TimelineEntry
+from instrumentation import QueryCounter
+import timeline
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -16,6 +19,7 @@ from models import db, connect_db, Message, User
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+os.environ['WARBLER_ENV'] = "test"
 
 # Now we can import app
 
@@ -38,6 +42,7 @@ class MessageViewTestCase(TestCase):
     def setUp(self):
         """Create test client, add sample data."""
 
+        Like.query.delete()
         User.query.delete()
         Message.query.delete()
 
@@ -70,3 +75,161 @@ class MessageViewTestCase(TestCase):
 
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
+
+    def test_add_message_fans_out_to_followers(self):
+        """Does a new message land on the author's and followers' timelines?"""
+
+        follower = User.signup(username="follower",
+                               email="follower@test.com",
+                               password="follower",
+                               image_url=None)
+        follower.following.append(self.testuser)
+        db.session.commit()
+
+        testuser_id = self.testuser.id
+        follower_id = follower.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = testuser_id
+
+            c.post("/messages/new", data={"text": "Hello"})
+
+            msg = Message.query.one()
+            self.assertEqual(
+                {e.user_id for e in TimelineEntry.query.all()},
+                {testuser_id, follower_id})
+            self.assertEqual(
+                timeline.home_timeline(User.query.get(follower_id)).items, [msg])
+
+    def test_celebrity_messages_pulled_into_timeline(self):
+        """Are a celebrity's messages merged into followers' timelines on
+        read, each once, including ones pushed before they crossed the
+        fan-out threshold?
+        """
+
+        follower = User.signup(username="follower",
+                               email="follower@test.com",
+                               password="follower",
+                               image_url=None)
+        follower.following.append(self.testuser)
+        db.session.flush()
+        User.recount()
+        db.session.commit()
+
+        testuser_id = self.testuser.id
+        follower_id = follower.id
+
+        self.addCleanup(app.config.__setitem__, 'TIMELINE_FANOUT_THRESHOLD',
+                        app.config['TIMELINE_FANOUT_THRESHOLD'])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = testuser_id
+
+            c.post("/messages/new", data={"text": "pushed"})
+
+            # one follower is now too many to fan out to
+            app.config['TIMELINE_FANOUT_THRESHOLD'] = 0
+
+            for text in ("pulled 1", "pulled 2", "pulled 3"):
+                c.post("/messages/new", data={"text": text})
+
+            self.assertEqual(
+                TimelineEntry.query.filter_by(user_id=follower_id).count(), 1)
+
+            follower = User.query.get(follower_id)
+            first = timeline.home_timeline(follower, limit=2)
+            second = timeline.home_timeline(follower, limit=2,
+                                            before=(first.items[-1].timestamp,
+                                                    first.items[-1].id))
+
+            self.assertEqual([m.text for m in first.items], ["pulled 3", "pulled 2"])
+            self.assertIsNotNone(first.next_cursor)
+            self.assertEqual([m.text for m in second.items], ["pulled 1", "pushed"])
+            self.assertIsNone(second.next_cursor)
+
+    def test_add_message_does_not_load_history(self):
+        """Does posting leave the author's earlier messages unloaded?"""
+
+        for i in range(3):
+            self.testuser.messages.append(Message(text=f"old {i}"))
+        db.session.commit()
+
+        testuser_id = self.testuser.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = testuser_id
+
+            with QueryCounter() as counter:
+                resp = c.post("/messages/new", data={"text": "Hello"})
+
+            self.assertEqual(resp.status_code, 302)
+            self.assertFalse([s for s in counter.statements
+                              if s.lstrip().startswith("SELECT") and "FROM messages" in s])
+
+    def test_followed_celebrities_cached(self):
+        """Is the reader's celebrity set read once, then refreshed when they
+        follow someone, with each celebrity's messages merged in order?
+        """
+
+        self.addCleanup(app.config.__setitem__, 'TIMELINE_FANOUT_THRESHOLD',
+                        app.config['TIMELINE_FANOUT_THRESHOLD'])
+        app.config['TIMELINE_FANOUT_THRESHOLD'] = 0
+
+        celebrity = User.signup(username="celebrity",
+                                email="celebrity@test.com",
+                                password="celebrity",
+                                image_url=None)
+        db.session.flush()
+
+        # interleaved, so every page needs both celebrities' messages
+        for i in range(6):
+            author = self.testuser if i % 2 else celebrity
+            author.messages.append(Message(text=f"msg {i}",
+                                           timestamp=datetime(2020, 1, 1, 0, i)))
+
+        # with a follower each, both are over the threshold of 0
+        celebrity.followers.append(self.testuser)
+        self.testuser.followers.append(celebrity)
+        db.session.flush()
+        User.recount()
+        db.session.commit()
+
+        testuser_id = self.testuser.id
+        celebrity_id = celebrity.id
+        other = User.signup(username="other",
+                            email="other@test.com",
+                            password="other",
+                            image_url=None)
+        db.session.commit()
+        other_id = other.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = other_id
+
+            c.post(f"/users/follow/{celebrity_id}")
+            timeline.home_timeline(User.query.get(other_id))
+
+            with QueryCounter() as counter:
+                timeline.home_timeline(User.query.get(other_id))
+            self.assertFalse([s for s in counter.statements if "FROM follows" in s])
+
+            c.post(f"/users/follow/{testuser_id}")
+
+            reader = User.query.get(other_id)
+            texts = []
+            before = None
+
+            while True:
+                page = timeline.home_timeline(reader, limit=2, before=before)
+                texts += [msg.text for msg in page.items]
+
+                if not page.next_cursor:
+                    break
+
+                before = (page.items[-1].timestamp, page.items[-1].id)
+
+        self.assertEqual(texts, [f"msg {i}" for i in reversed(range(6))])
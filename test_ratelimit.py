@@ -0,0 +1,77 @@
+"""Rate limiter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ratelimit.py
+
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from ratelimit import MemoryBackend
+
+
+class MemoryBackendTestCase(TestCase):
+    """Test the in-process token buckets, on a fake clock."""
+
+    def setUp(self):
+        """Start the clock at 1000 seconds."""
+
+        self.now = 1000.0
+        clock = patch('ratelimit.time.monotonic', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+        self.backend = MemoryBackend()
+
+    def test_take_until_empty(self):
+        """Does a bucket hand out `count` tokens, then say how long to wait?"""
+
+        for _ in range(3):
+            self.assertEqual(self.backend.take("k", 3, 60), 0)
+
+        # refills at 3 per 60s, so the next token is 20s away
+        self.assertAlmostEqual(self.backend.take("k", 3, 60), 20)
+
+        self.now += 5
+        self.assertAlmostEqual(self.backend.take("k", 3, 60), 15)
+
+    def test_refill(self):
+        """Does an emptied bucket refill with time, up to `count`?"""
+
+        for _ in range(3):
+            self.backend.take("k", 3, 60)
+
+        self.now += 20
+        self.assertEqual(self.backend.take("k", 3, 60), 0)
+        self.assertGreater(self.backend.take("k", 3, 60), 0)
+
+        # an hour is far more than a full bucket's worth
+        self.now += 3600
+        for _ in range(3):
+            self.assertEqual(self.backend.take("k", 3, 60), 0)
+        self.assertGreater(self.backend.take("k", 3, 60), 0)
+
+    def test_buckets_are_separate(self):
+        """Does emptying one bucket leave the others alone?"""
+
+        self.backend.take("a", 1, 60)
+
+        self.assertGreater(self.backend.take("a", 1, 60), 0)
+        self.assertEqual(self.backend.take("b", 1, 60), 0)
+
+    def test_evicts_least_recently_used(self):
+        """Past `maxsize`, is the least recently used bucket forgotten?"""
+
+        backend = MemoryBackend(maxsize=2)
+
+        backend.take("a", 1, 60)
+        backend.take("b", 1, 60)
+        backend.take("a", 1, 60)   # "a" is now the more recently used
+        backend.take("c", 1, 60)
+
+        self.assertEqual(list(backend._buckets), ["a", "c"])
+
+        # forgotten, so full again
+        self.assertEqual(backend.take("b", 1, 60), 0)
+        self.assertGreater(backend.take("c", 1, 60), 0)
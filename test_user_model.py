@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, User, Message, Follows
+from models import db, bcrypt, User, Message, Follows, Like
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -16,6 +16,7 @@ from models import db, User, Message, Follows
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+os.environ['WARBLER_ENV'] = "test"
 
 # Now we can import app
 
@@ -34,6 +35,7 @@ class UserModelTestCase(TestCase):
     def setUp(self):
         """Create test client, add sample data."""
 
+        Like.query.delete()
         User.query.delete()
         Message.query.delete()
         Follows.query.delete()
@@ -83,13 +85,92 @@ class UserModelTestCase(TestCase):
         self.assertEqual(len(self.user1.following), 1)
         self.assertEqual(len(self.user1.followers), 0)
 
+    def test_follow_updates_counts(self):
+        """Do follow/unfollow keep the denormalized counts in step?"""
 
+        user1 = User.query.filter_by(username="testuser1").one()
+        user2 = User.query.filter_by(username="testuser2").one()
 
+        user1.follow(user2)
+        db.session.commit()
+
+        self.assertEqual(user1.following_count, 1)
+        self.assertEqual(user2.followers_count, 1)
+
+        user1.unfollow(user2)
+        db.session.commit()
+
+        self.assertEqual(user1.following_count, 0)
+        self.assertEqual(user2.followers_count, 0)
+
+    def test_follow_twice_counts_once(self):
+        """Does a repeated follow or unfollow leave the counts alone?"""
+
+        user1 = User.query.filter_by(username="testuser1").one()
+        user2 = User.query.filter_by(username="testuser2").one()
 
+        self.assertTrue(user1.follow(user2))
+        self.assertFalse(user1.follow(user2))
+        db.session.commit()
+
+        self.assertEqual(user1.following_count, 1)
+        self.assertEqual(user2.followers_count, 1)
+
+        self.assertTrue(user1.unfollow(user2))
+        self.assertFalse(user1.unfollow(user2))
+        db.session.commit()
 
+        self.assertEqual(user1.following_count, 0)
+        self.assertEqual(user2.followers_count, 0)
 
+    def test_is_following(self):
+        """Do the follow-state checks agree with the follows table?"""
 
+        user1 = User.query.filter_by(username="testuser1").one()
+        user2 = User.query.filter_by(username="testuser2").one()
+
+        self.assertFalse(user1.is_following(user2))
+
+        user1.follow(user2)
+        db.session.commit()
 
+        self.assertTrue(user1.is_following(user2))
+        self.assertTrue(user2.is_followed_by(user1))
+        self.assertFalse(user2.is_following(user1))
+        self.assertEqual(user1.following_ids(), {user2.id})
+        self.assertEqual(user2.following_ids(), set())
 
+    def test_toggle_like(self):
+        """Does toggle_like flip the like and keep likes_count in step?"""
+
+        user1 = User.query.filter_by(username="testuser1").one()
+        user2 = User.query.filter_by(username="testuser2").one()
+        msg = Message(text="hello", user_id=user2.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.assertTrue(user1.toggle_like(msg.id))
+        db.session.commit()
+
+        self.assertEqual(user1.likes_count, 1)
+        self.assertEqual(Like.query.filter_by(user_id=user1.id).count(), 1)
+
+        self.assertFalse(user1.toggle_like(msg.id))
+        db.session.commit()
+
+        self.assertEqual(user1.likes_count, 0)
+        self.assertEqual(Like.query.filter_by(user_id=user1.id).count(), 0)
+
+    def test_authenticate_rehashes_old_cost(self):
+        """Is a password hashed at an older cost upgraded on login?"""
+
+        user1 = User.query.filter_by(username="testuser1").one()
+        user1.password = bcrypt.generate_password_hash("secret", 5).decode('UTF-8')
+        db.session.commit()
+
+        self.assertEqual(User.authenticate("testuser1", "secret"), user1)
+        db.session.commit()
 
-    
+        rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.assertTrue(user1.password.startswith(f"$2b${rounds:02}$"))
+        self.assertTrue(User.authenticate("testuser1", "secret"))
@@ -0,0 +1,412 @@
+"""User View tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_user_views.py
+
+
+import os
+import re
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import g, session
+
+from models import db, credentials, Message, User, Follows, Like
+from instrumentation import max_queries
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+os.environ['WARBLER_ENV'] = "test"
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+from cache import user_cache
+from search import trigram_search_available
+import autocomplete
+import cache
+import ratelimit
+import timeline
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class UserViewTestBase(TestCase):
+    """Sample data for the user view tests."""
+
+    def setUp(self):
+        """Create test client; a user following and liking several others."""
+
+        self.client = app.test_client()
+
+        # fresh caches, so nothing an earlier test cached leaks in
+        cache.init_app(app)
+        autocomplete.init_app(app)
+
+        with app.app_context():
+            Like.query.delete()
+            Follows.query.delete()
+            Message.query.delete()
+            User.query.delete()
+
+            testuser = User(username="testuser",
+                            email="test@test.com",
+                            password="HASHED_PASSWORD")
+            others = [User(username=f"other{i}",
+                           email=f"other{i}@test.com",
+                           password="HASHED_PASSWORD",
+                           messages=[Message(text=f"msg {i}-{j}") for j in range(3)])
+                      for i in range(5)]
+
+            db.session.add_all([testuser] + others)
+
+            for other in others:
+                testuser.following.append(other)
+                other.following.append(testuser)
+                testuser.liked_messages.extend(other.messages)
+
+            db.session.flush()
+            User.recount()
+            timeline.rebuild()
+            db.session.commit()
+
+            self.testuser_id = testuser.id
+
+
+class UserViewQueryBudgetTestCase(UserViewTestBase):
+    """Do list pages run a constant number of queries?"""
+
+    def assert_page_within_budget(self, url, budget):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            with max_queries(budget):
+                resp = c.get(url)
+                # streamed pages only run their queries as the body is read
+                resp.get_data()
+
+            self.assertEqual(resp.status_code, 200)
+
+    def test_homepage(self):
+        self.assert_page_within_budget("/", 4)
+
+    def test_user_show(self):
+        self.assert_page_within_budget(f"/users/{self.testuser_id}", 4)
+
+    def test_following(self):
+        self.assert_page_within_budget(f"/users/{self.testuser_id}/following", 3)
+
+    def test_followers(self):
+        self.assert_page_within_budget(f"/users/{self.testuser_id}/followers", 3)
+
+    def test_likes(self):
+        self.assert_page_within_budget(f"/users/{self.testuser_id}/likes", 2)
+
+    def test_list_users(self):
+        self.assert_page_within_budget("/users", 3)
+
+
+
+class UserViewTestCase(UserViewTestBase):
+    """Test views for users."""
+
+    def test_search_users(self):
+        """Does searching by username page through the matches?"""
+
+        self.addCleanup(app.config.__setitem__, 'USERS_PAGE_SIZE', app.config['USERS_PAGE_SIZE'])
+        app.config['USERS_PAGE_SIZE'] = 3
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.get("/users?q=other")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(html.count("@other"), 3)
+            self.assertNotIn("@testuser", html)
+            self.assertIn("More users", html)
+
+    def test_search_users_pages_through_ties(self):
+        """Does paging a search return every match once when many tie on
+        the ranking (here other1-4, at a similarity float4 can't hold exactly)?
+        """
+
+        with app.app_context():
+            if not trigram_search_available():
+                self.skipTest("other1-4 only match other0 by trigram similarity")
+
+        self.addCleanup(app.config.__setitem__, 'USERS_PAGE_SIZE', app.config['USERS_PAGE_SIZE'])
+        app.config['USERS_PAGE_SIZE'] = 2
+
+        found = []
+        url = "/users?q=other0"
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            # a cursor that repeats rows could page forever; five pages is plenty
+            for _ in range(5):
+                if not url:
+                    break
+
+                html = c.get(url).get_data(as_text=True)
+                found += re.findall(r"<p>@(other\d)</p>", html)
+                more = re.search(r'href="(/users\?q=other0&after=[^"]+)"', html)
+                url = more and more.group(1)
+
+        self.assertEqual(sorted(found), [f"other{i}" for i in range(5)])
+
+    def test_search_users_bad_cursor(self):
+        resp = self.client.get("/users?q=other&after=WzAuNSxbMV1d")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_like_json(self):
+        """Does a like asked for as JSON answer with the new state?"""
+
+        with app.app_context():
+            message_id = Message.query.first().id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            resp = c.post(f"/messages/{message_id}/like",
+                          headers={'Accept': 'application/json'})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json, {'message_id': message_id,
+                                         'liked': False,
+                                         'likes_count': 14})
+
+    def test_like_sets_requested_state(self):
+        """Does a like or unlike that's already in effect (e.g. sent from a
+        page with a stale star) leave it be, rather than toggle it?
+        """
+
+        with app.app_context():
+            message_id = Message.query.first().id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            states = []
+
+            for like in ("1", "0", "0", "1"):
+                resp = c.post(f"/messages/{message_id}/like", data={"like": like},
+                              headers={'Accept': 'application/json'})
+                states.append((resp.json['liked'], resp.json['likes_count']))
+
+        self.assertEqual(states, [(True, 15), (False, 14), (False, 14), (True, 15)])
+
+    def test_user_show_stars(self):
+        """Are the stars on a profile the viewer's likes?"""
+
+        with app.app_context():
+            other_id = User.query.filter_by(username="other0").one().id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            html = c.get(f"/users/{other_id}").get_data(as_text=True)
+            self.assertEqual(html.count("fas fa-star"), 3)
+
+            html = c.get(f"/users/{self.testuser_id}").get_data(as_text=True)
+            self.assertNotIn("fas fa-star", html)
+
+    def test_user_show_logged_out(self):
+        with app.app_context():
+            other_id = User.query.filter_by(username="other0").one().id
+
+        resp = self.client.get(f"/users/{other_id}")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_user_loaded_lazily(self):
+        """Is g.user loaded on first read, yet present to get() and `in`?"""
+
+        with app.test_request_context():
+            session[CURR_USER_KEY] = self.testuser_id
+
+            self.assertNotIn('user', vars(g))
+            self.assertIn('user', g)
+            self.assertEqual(g.get('user').id, self.testuser_id)
+            self.assertIn('user', vars(g))
+
+    def test_user_reloaded_per_request(self):
+        """Does each request in one outer app context load its own g.user?"""
+
+        with app.app_context(), self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            self.assertNotIn("Sign up now", c.get("/").get_data(as_text=True))
+
+            with c.session_transaction() as sess:
+                del sess[CURR_USER_KEY]
+
+            self.assertIn("Sign up now", c.get("/").get_data(as_text=True))
+
+    def test_login_rate_limited(self):
+        """Is a login over the username's limit refused with a 429, before
+        any password is checked?
+        """
+
+        self.addCleanup(ratelimit.init_app, app)
+        self.addCleanup(app.config.__setitem__, 'AUTH_LIMIT_PER_USERNAME',
+                        app.config['AUTH_LIMIT_PER_USERNAME'])
+        app.config['AUTH_LIMIT_PER_USERNAME'] = (2, 60)
+        ratelimit.init_app(app)
+
+        login = {"username": "testuser", "password": "wrong password"}
+
+        with patch.object(credentials, 'check', return_value=False) as check:
+            for _ in range(2):
+                self.assertEqual(self.client.post("/login", data=login).status_code, 200)
+
+            resp = self.client.post("/login", data=login)
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], "30")
+        self.assertEqual(check.call_count, 2)
+
+    def test_profile_edit_refreshes_cache_and_index(self):
+        """After a rename, do g.user and autocomplete have the new name?"""
+
+        profile = {"username": "renamed", "email": "renamed@test.com",
+                   "password": "password"}
+
+        with patch.object(credentials, 'check', return_value=True), self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            self.assertEqual(len(c.get("/users/autocomplete?q=test").json), 1)
+            self.assertIn('value="testuser"', c.get("/users/profile").get_data(as_text=True))
+
+            resp = c.post("/users/profile", data=profile)
+            self.assertEqual(resp.status_code, 302)
+
+            self.assertIn('value="renamed"', c.get("/users/profile").get_data(as_text=True))
+            self.assertEqual(c.get("/users/autocomplete?q=test").json, [])
+            self.assertEqual(c.get("/users/autocomplete?q=ren").json,
+                             [{"id": self.testuser_id, "username": "renamed"}])
+
+    def test_autocomplete_reloads(self):
+        """Are users added elsewhere (e.g. by another worker) suggested once
+        the index is due a reload?
+        """
+
+        self.assertEqual(self.client.get("/users/autocomplete?q=late").json, [])
+
+        with app.app_context():
+            db.session.add(User(username="latecomer", email="late@test.com",
+                                password="HASHED_PASSWORD"))
+            db.session.commit()
+
+        self.assertEqual(self.client.get("/users/autocomplete?q=late").json, [])
+
+        later = time.monotonic() + app.config['AUTOCOMPLETE_RELOAD_SECONDS'] + 1
+
+        with patch('autocomplete.time.monotonic', return_value=later):
+            users = self.client.get("/users/autocomplete?q=late").json
+
+        self.assertEqual([user['username'] for user in users], ["latecomer"])
+
+    def test_unfollow_refreshes_cached_counts(self):
+        with app.app_context():
+            other_id = User.query.filter_by(username="other0").one().id
+            user_cache().get(other_id)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.get("/")
+            c.post(f"/users/stop-following/{other_id}")
+
+        with app.app_context():
+            self.assertEqual(user_cache().get(self.testuser_id).following_count, 4)
+            self.assertEqual(user_cache().get(other_id).followers_count, 0)
+
+    def test_delete_user_drops_cache_and_index(self):
+        with app.app_context():
+            other_id = User.query.filter_by(username="other0").one().id
+            self.assertEqual(user_cache().get(other_id).following_count, 1)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            self.assertEqual(len(c.get("/users/autocomplete?q=test").json), 1)
+
+            resp = c.post("/users/delete")
+            self.assertEqual(resp.status_code, 302)
+
+            self.assertEqual(c.get("/users/autocomplete?q=test").json, [])
+
+        with app.app_context():
+            self.assertIsNone(user_cache().get(self.testuser_id))
+            self.assertEqual(user_cache().get(other_id).following_count, 0)
+
+    def test_streamed_page_saves_session(self):
+        """Does a streamed page take its flashed messages out of the session,
+        and keep the CSRF secret its forms were rendered with?
+        """
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+                sess['_flashes'] = [("success", "Message liked!")]
+
+            html = c.get(f"/users/{self.testuser_id}/likes").get_data(as_text=True)
+            self.assertIn("Message liked!", html)
+
+            with c.session_transaction() as sess:
+                self.assertNotIn('_flashes', sess)
+                self.assertIn('csrf_token', sess)
+
+            self.assertNotIn("Message liked!", c.get("/").get_data(as_text=True))
+
+    def test_follow_again_or_self(self):
+        """Do a repeated follow and a self-follow succeed without changing
+        anything?
+        """
+
+        with app.app_context():
+            other_id = User.query.filter_by(username="other0").one().id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.post("/messages/new", data={"text": "my own"})
+
+            resp = c.post(f"/users/follow/{other_id}")
+            self.assertEqual(resp.status_code, 302)
+
+            resp = c.post(f"/users/follow/{self.testuser_id}")
+            self.assertEqual(resp.status_code, 302)
+
+        with app.app_context():
+            testuser = User.query.get(self.testuser_id)
+            self.assertEqual(testuser.following_count, 5)
+            self.assertEqual(User.query.get(other_id).followers_count, 1)
+            self.assertFalse(Follows.exists(follower=testuser, followed=testuser))
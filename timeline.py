@@ -0,0 +1,210 @@
+"""Materialized home timelines for Warbler.
+
+Every message is fanned out on write: posting copies a pointer to the
+message into the `timeline_entries` of its author and of each follower.
+Reading a home timeline is then one indexed range read, no matter how many
+users someone follows.
+
+Accounts with more followers than the app's TIMELINE_FANOUT_THRESHOLD
+("celebrities") are not fanned out, so one post can't turn into 100k
+inserts. Their recent messages are pulled and merged in when a follower's
+timeline is read instead; which celebrities a reader follows is cached
+(see cache.FollowedCelebritiesCache).
+"""
+
+from flask import current_app
+from sqlalchemy import delete, insert, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload
+
+from cache import followed_celebrities_cache
+from models import db, Follows, Message, TimelineEntry, User
+from pagination import make_page
+
+# How many of a user's most recent messages are copied into a new
+# follower's timeline when the follow happens.
+BACKFILL_LIMIT = 200
+
+
+def _is_celebrity(user_id):
+    """SQL expression: is `user_id` over the fan-out threshold?"""
+
+    followers_count = (select(User.followers_count)
+                       .where(User.id == user_id)
+                       .scalar_subquery())
+
+    return followers_count > current_app.config['TIMELINE_FANOUT_THRESHOLD']
+
+
+def fan_out(msg):
+    """Deliver (flushed) `msg` to its author's and followers' timelines.
+
+    Celebrity messages only go to the author's own timeline; followers
+    pull them at read time.
+    """
+
+    followers = (select(Follows.user_following_id)
+                 .where(Follows.user_being_followed_id == msg.user_id)
+                 .where(~_is_celebrity(msg.user_id)))
+
+    recipients = followers.union_all(select(literal(msg.user_id))).subquery()
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'timestamp'],
+            select(recipients.c[0],
+                   literal(msg.id),
+                   literal(msg.timestamp, TimelineEntry.timestamp.type)),
+        )
+    )
+
+
+def backfill(follower, followed_user):
+    """Copy `followed_user`'s recent messages into `follower`'s timeline.
+
+    Nothing is copied for celebrities, since they are pulled at read time,
+    nor any message that is already there.
+    """
+
+    already_delivered = (select(TimelineEntry.message_id)
+                         .where(TimelineEntry.user_id == follower.id)
+                         .where(TimelineEntry.message_id == Message.id)
+                         .exists())
+
+    recent = (
+        select(literal(follower.id), Message.id, Message.timestamp)
+        .where(Message.user_id == followed_user.id)
+        .where(~_is_celebrity(followed_user.id))
+        .where(~already_delivered)
+        .order_by(Message.timestamp.desc())
+        .limit(BACKFILL_LIMIT)
+    )
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'timestamp'], recent)
+    )
+
+
+def remove(follower, followed_user):
+    """Drop `followed_user`'s messages from `follower`'s timeline."""
+
+    followed_msg_ids = (select(Message.id)
+                        .where(Message.user_id == followed_user.id)
+                        .scalar_subquery())
+
+    db.session.execute(
+        delete(TimelineEntry)
+        .where(TimelineEntry.user_id == follower.id)
+        .where(TimelineEntry.message_id.in_(followed_msg_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild():
+    """Rebuild every timeline from `messages` and `follows`.
+
+    Used after bulk loads (seed.py) and to repair drift.
+    """
+
+    db.session.execute(delete(TimelineEntry))
+
+    own = select(Message.user_id, Message.id, Message.timestamp)
+    followed = (
+        select(Follows.user_following_id, Message.id, Message.timestamp)
+        .join(Message, Message.user_id == Follows.user_being_followed_id)
+        .where(~_is_celebrity(Follows.user_being_followed_id))
+    )
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'timestamp'], own.union_all(followed))
+    )
+
+
+def _followed_celebrity_ids(user):
+    """Ids of the celebrities `user` follows."""
+
+    cache = followed_celebrities_cache()
+    celebrity_ids = cache.get(user.id)
+
+    if celebrity_ids is None:
+        celebrity_ids = (db.session
+                         .execute(select(Follows.user_being_followed_id)
+                                  .where(Follows.user_following_id == user.id)
+                                  .where(_is_celebrity(Follows.user_being_followed_id)))
+                         .scalars()
+                         .all())
+        cache.set(user.id, celebrity_ids)
+
+    return celebrity_ids
+
+
+def _recent_message_ids(user_ids, limit, before=None):
+    """Select the ids of the `limit` newest messages (before `before`) of
+    each of `user_ids`.
+
+    Each user's are a separate range read of the (user_id, timestamp, id)
+    index, so no user's older messages are read or sorted.
+    """
+
+    per_user = []
+
+    for user_id in user_ids:
+        recent = (select(Message.id)
+                  .where(Message.user_id == user_id)
+                  .order_by(Message.timestamp.desc(), Message.id.desc())
+                  .limit(limit))
+
+        if before:
+            recent = recent.where(tuple_(Message.timestamp, Message.id) < before)
+
+        # a subquery each, since not every backend allows LIMIT inside UNION
+        recent = recent.subquery()
+        per_user.append(select(recent.c.id))
+
+    return union_all(*per_user)
+
+
+def _sort_key(msg):
+    return (msg.timestamp, msg.id)
+
+
+def home_timeline(user, limit=20, before=None):
+    """Return a Page of the messages on `user`'s home timeline.
+
+    Messages are newest first, keyed on (timestamp, id); `before` is the
+    key the page starts after. Pushed entries are merged with the recent
+    messages of any celebrities `user` follows.
+    """
+
+    pushed = (Message
+              .query
+              .options(joinedload(Message.user))
+              .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+              .filter(TimelineEntry.user_id == user.id)
+              .order_by(TimelineEntry.timestamp.desc(),
+                        TimelineEntry.message_id.desc()))
+
+    if before:
+        pushed = pushed.filter(
+            tuple_(TimelineEntry.timestamp, TimelineEntry.message_id) < before)
+
+    messages = pushed.limit(limit + 1).all()
+
+    celebrity_ids = _followed_celebrity_ids(user)
+
+    if celebrity_ids:
+        pulled = (Message
+                  .query
+                  .options(joinedload(Message.user))
+                  .filter(Message.id.in_(
+                      _recent_message_ids(celebrity_ids, limit + 1, before)))
+                  .order_by(Message.timestamp.desc(), Message.id.desc())
+                  .limit(limit + 1))
+
+        # an account may have crossed the threshold after some of its
+        # messages were pushed, so the two sources can overlap
+        merged = {msg.id: msg for msg in messages + pulled.all()}
+        messages = sorted(merged.values(), key=_sort_key, reverse=True)
+
+    return make_page(messages, limit, _sort_key)